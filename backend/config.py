@@ -12,16 +12,40 @@ class Config:
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "postgres")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
     
+    # Connection pool settings (shared SQLAlchemy engine)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "5"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_WARM_SIZE: int = int(os.getenv("DB_POOL_WARM_SIZE", "5"))
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+    SQL_ECHO: bool = os.getenv("SQL_ECHO", "False").lower() == "true"
+    
+    # PostgreSQL listener -> Redis publish batching
+    PG_PUBLISH_BATCH_MAX: int = int(os.getenv("PG_PUBLISH_BATCH_MAX", "100"))
+    PG_PUBLISH_LINGER_MS: int = int(os.getenv("PG_PUBLISH_LINGER_MS", "5"))
+    PG_DEDUP_UPDATES: bool = os.getenv("PG_DEDUP_UPDATES", "True").lower() == "true"
+    
     # Redis settings
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     REDIS_PASSWORD: Optional[str] = os.getenv("REDIS_PASSWORD")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+    MESSAGE_CACHE_TTL: int = int(os.getenv("MESSAGE_CACHE_TTL", "3600"))
+    
+    # Streaming settings
+    STREAM_QUEUE_SIZE: int = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+    STREAM_FLUSH_BYTES: int = int(os.getenv("STREAM_FLUSH_BYTES", "16384"))
+    STREAM_FLUSH_EVENTS: int = int(os.getenv("STREAM_FLUSH_EVENTS", "16"))
+    STREAM_LINGER_MS: int = int(os.getenv("STREAM_LINGER_MS", "20"))
+    STREAM_KEEPALIVE_SECONDS: int = int(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
     
     # App settings
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
     
     # Pagination
     DEFAULT_PAGE_SIZE: int = 20
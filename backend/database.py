@@ -1,15 +1,26 @@
-from sqlalchemy import Column, Integer, Text, String, DateTime, UUID, Index
+from sqlalchemy import Column, Computed, Integer, Text, String, DateTime, UUID, Index
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
 from typing import Optional
+import asyncio
 import uuid
 
 from config import Config
 
-# Create async engine
-engine = create_async_engine(Config.DATABASE_URL, echo=Config.DEBUG)
+# Create async engine (shared by every request through AsyncSessionLocal)
+engine = create_async_engine(
+    Config.DATABASE_URL,
+    echo=Config.SQL_ECHO,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    # Per-connection asyncpg prepared statement cache
+    connect_args={"prepared_statement_cache_size": Config.DB_STATEMENT_CACHE_SIZE}
+)
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
@@ -17,28 +28,53 @@ Base = declarative_base()
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     content = Column(Text, nullable=False)
+    # Maintained by Postgres so list pages can skip detoasting long content
+    content_preview = Column(String(200), Computed("left(content, 200)", persisted=True))
     file = Column(String(50), nullable=True)
     created_date = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    sender_id = Column(UUID, nullable=False, index=True)
+    sender_id = Column(UUID, nullable=False)
     
     def __repr__(self):
         return f"<Message(id={self.id}, content='{self.content[:50]}...', sender_id={self.sender_id})>"
 
-# Create indexes
-Index('idx_messages_created_date', Message.created_date)
-Index('idx_messages_sender_id', Message.sender_id)
+# Create indexes, ordered to match the (created_date DESC, id DESC) keyset
+Index('idx_messages_created_id', Message.created_date.desc(), Message.id.desc())
+Index('idx_messages_sender_created', Message.sender_id, Message.created_date.desc(), Message.id.desc())
 
 async def get_db() -> AsyncSession:
-    """Dependency to get database session"""
+    """Dependency to get database session (closed by the context manager)"""
     async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
+        yield session
+
+# create_all never alters an existing table, so bring older schemas up to date
+# in place; every statement is a no-op once applied
+SCHEMA_UPGRADE_STATEMENTS = (
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_preview VARCHAR(200) "
+    "GENERATED ALWAYS AS (left(content, 200)) STORED",
+    "CREATE INDEX IF NOT EXISTS idx_messages_created_id ON messages (created_date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_sender_created ON messages (sender_id, created_date DESC, id DESC)",
+    # Superseded by the two composite indexes above
+    "DROP INDEX IF EXISTS idx_messages_created_date",
+    "DROP INDEX IF EXISTS idx_messages_sender_id",
+)
 
 async def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and upgrade existing ones"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADE_STATEMENTS:
+            await conn.exec_driver_sql(statement)
+
+async def warm_pool():
+    """Open pooled connections up front so the first requests skip the connect handshake"""
+    size = min(Config.DB_POOL_WARM_SIZE, Config.DB_POOL_SIZE)
+    connections = await asyncio.gather(*(engine.connect() for _ in range(size)))
+    # Closing returns them to the pool, still open
+    for connection in connections:
+        await connection.close()
+
+async def close_db():
+    """Dispose of the engine's connection pool"""
+    await engine.dispose()
@@ -6,16 +6,17 @@
 CREATE TABLE messages (
     id SERIAL PRIMARY KEY,
     content TEXT NOT NULL,
+    content_preview VARCHAR(200) GENERATED ALWAYS AS (left(content, 200)) STORED,
     file VARCHAR(50),
     created_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     sender_id UUID NOT NULL
 );
 
--- Create index on created_date for efficient cursor pagination
-CREATE INDEX idx_messages_created_date ON messages(created_date);
+-- Create composite index matching the (created_date DESC, id DESC) keyset used for pagination
+CREATE INDEX idx_messages_created_id ON messages(created_date DESC, id DESC);
 
--- Create index on sender_id for efficient queries
-CREATE INDEX idx_messages_sender_id ON messages(sender_id);
+-- Create index on sender_id for efficient per-sender queries in the same order
+CREATE INDEX idx_messages_sender_created ON messages(sender_id, created_date DESC, id DESC);
 
 -- Enable row level security (optional)
 ALTER TABLE messages ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,32 @@
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+from config import Config
+
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging():
+    """Route application logs through a queue so the event loop never blocks on stream writes"""
+    global _queue_listener
+    if _queue_listener:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(Config.LOG_LEVEL)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    # The listener thread does the actual I/O
+    _queue_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _queue_listener.start()
+
+def stop_logging():
+    """Flush queued log records and stop the listener thread"""
+    global _queue_listener
+    if _queue_listener:
+        _queue_listener.stop()
+        _queue_listener = None
@@ -2,33 +2,137 @@ from starlette.applications import Starlette
 from starlette.routing import Route, WebSocketRoute
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
 from starlette.requests import Request
 from starlette.websockets import WebSocket
 from starlette.background import BackgroundTask
-import json
 import asyncio
+import orjson
+import base64
+import binascii
+import zlib
+import hashlib
 from datetime import datetime
 import uuid
 from typing import Optional
-from sqlalchemy import select, desc, asc
+from sqlalchemy import select, insert, exists, desc, tuple_, bindparam, Integer, DateTime
+from sqlalchemy.orm import aliased
 
-from database import get_db, init_db, Message, AsyncSessionLocal
+from database import init_db, warm_pool, close_db, engine, Message, AsyncSessionLocal
 from redis_client import redis_client
 from postgres_listener import postgres_listener
-from models import MessageCreate, MessageResponse, MessageListResponse, PaginationParams
+from message_broadcaster import message_broadcaster
+from message_store import MESSAGE_COLUMNS, SENDER_ID_COLUMN, cache_message, get_message_json
+from models import MessageCreate, MessageResponse, PaginationParams
 from config import Config
+from logging_config import setup_logging, stop_logging
+from responses import ORJSONResponse
+
+# Static SSE framing, encoded once
+SSE_DATA_PREFIX = b"data: "
+SSE_EVENT_SUFFIX = b"\n\n"
+CONNECTED_EVENT = orjson.dumps({'type': 'connected', 'message': 'Connected to message stream'})
+SSE_CONNECTED_EVENT = SSE_DATA_PREFIX + CONNECTED_EVENT + SSE_EVENT_SUFFIX
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+# Response headers for the SSE stream, built once rather than per connection
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Cache-Control"
+}
+# GZipMiddleware passes responses that already set Content-Encoding through untouched
+SSE_GZIP_HEADERS = {**SSE_HEADERS, "Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+
+def sse_event(payload: dict) -> bytes:
+    """Frame a payload as a single SSE data event"""
+    return SSE_DATA_PREFIX + orjson.dumps(payload) + SSE_EVENT_SUFFIX
+
+async def coalesce_sse_events(queue: asyncio.Queue):
+    """Frame queued events as SSE, batching bursts within the linger window and sending keepalives while idle"""
+    loop = asyncio.get_running_loop()
+    linger = Config.STREAM_LINGER_MS / 1000
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), Config.STREAM_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            # Keep idle connections from being closed by proxies and load balancers
+            yield SSE_KEEPALIVE
+            continue
+        buffer = bytearray(SSE_DATA_PREFIX + event + SSE_EVENT_SUFFIX)
+        count = 1
+        deadline = loop.time() + linger
+        while len(buffer) < Config.STREAM_FLUSH_BYTES and count < Config.STREAM_FLUSH_EVENTS:
+            try:
+                event = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            buffer += SSE_DATA_PREFIX + event + SSE_EVENT_SUFFIX
+            count += 1
+        yield bytes(buffer)
+
+async def gzip_stream(chunks):
+    """Gzip a byte stream, sync-flushing after every chunk so events are not held back"""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+# Hot-path queries, built once so every request reuses the same cached
+# compilation and asyncpg prepared statement; ordering matches idx_messages_created_id
+PREVIEW_COLUMNS = (Message.id, Message.content_preview.label("content"), Message.file, Message.created_date, SENDER_ID_COLUMN)
+BEFORE_CURSOR = tuple_(Message.created_date, Message.id) < tuple_(
+    bindparam("cursor_date", type_=DateTime(timezone=True)),
+    bindparam("cursor_id", type_=Integer)
+)
+
+def build_list_stmt(columns, before_cursor: bool):
+    """Build a newest-first page query (optionally after a cursor) that also reports whether older messages exist"""
+    page = select(*columns).order_by(desc(Message.created_date), desc(Message.id)).limit(bindparam("limit", type_=Integer))
+    if before_cursor:
+        page = page.where(BEFORE_CURSOR)
+    page = page.cte("page")
+    # Oldest row of the page; the probe below is uncorrelated, so it runs once
+    last = select(page.c.created_date, page.c.id).order_by(page.c.created_date, page.c.id).limit(1).subquery("last")
+    older = aliased(Message)
+    has_more = select(
+        exists().where(tuple_(older.created_date, older.id) < tuple_(last.c.created_date, last.c.id))
+    ).select_from(last).scalar_subquery()
+    return (
+        select(*page.c, has_more.label("has_more"))
+        .order_by(desc(page.c.created_date), desc(page.c.id))
+    )
+
+# Keyed by (preview, before_cursor)
+LIST_MESSAGES_STMTS = {
+    (preview, before_cursor): build_list_stmt(PREVIEW_COLUMNS if preview else MESSAGE_COLUMNS, before_cursor)
+    for preview in (False, True)
+    for before_cursor in (False, True)
+}
 
-# Initialize Redis connection
 async def startup():
+    setup_logging()
     await redis_client.connect()
     await init_db()
+    await warm_pool()
     # Start PostgreSQL listener in background
     asyncio.create_task(postgres_listener.start())
 
 async def shutdown():
-    await redis_client.disconnect()
+    # Stop the listener first so its last publish still has a Redis connection
     await postgres_listener.stop()
+    await redis_client.disconnect()
+    # Dispose the pool only after the listener has stopped
+    await close_db()
+    stop_logging()
 
 # Define all endpoint functions FIRST
 async def message_endpoint(request: Request):
@@ -38,142 +142,210 @@ async def message_endpoint(request: Request):
     elif request.method == "POST":
         return await create_message(request)
 
+def encode_cursor(created_date: datetime, message_id: int) -> str:
+    """Encode the (created_date, id) keyset position as an opaque cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps([created_date, message_id])).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        created_date, message_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_date), int(message_id)
+    except (binascii.Error, TypeError, UnicodeDecodeError, orjson.JSONDecodeError) as e:
+        raise ValueError(str(e))
+
 async def get_messages(request: Request):
-    """Get paginated messages using cursor pagination"""
+    """Get paginated messages (newest first) using keyset pagination on (created_date, id)"""
     try:
         # Parse query parameters
         cursor = request.query_params.get("cursor")
         limit = int(request.query_params.get("limit", Config.DEFAULT_PAGE_SIZE))
-        limit = min(limit, Config.MAX_PAGE_SIZE)
+        limit = max(1, min(limit, Config.MAX_PAGE_SIZE))
+        # Previews skip detoasting long content; full text comes from GET /api/message/{id}
+        preview = request.query_params.get("preview", "false").lower() == "true"
         
         # Create database session directly
         async with AsyncSessionLocal() as db:
-            # Build query using SQLAlchemy 2.0 syntax
-            stmt = select(Message).order_by(asc(Message.created_date))
+            params = {"limit": limit}
             
             if cursor:
                 try:
-                    # Decode cursor (timestamp in ISO format)
-                    cursor_date = datetime.fromisoformat(cursor)
-                    stmt = stmt.where(Message.created_date < cursor_date)
+                    params["cursor_date"], params["cursor_id"] = decode_cursor(cursor)
                 except ValueError:
-                    return JSONResponse({"error": "Invalid cursor format"}, status_code=400)
-            
-            # Get messages with limit + 1 to check if there are more
-            result = await db.execute(stmt.limit(limit + 1))
-            message_list = result.scalars().all()
+                    return ORJSONResponse({"error": "Invalid cursor format"}, status_code=400)
             
-            # Check if there are more messages
-            has_more = len(message_list) > limit
-            if has_more:
-                message_list = message_list[:-1]  # Remove the extra message
+            result = await db.execute(LIST_MESSAGES_STMTS[preview, bool(cursor)], params)
+            # Plain column rows: no ORM instances or identity map for a read-only page
+            messages = [dict(row) for row in result.mappings()]
             
-            # Create response
-            message_responses = [
-                MessageResponse(
-                    id=msg.id,
-                    content=msg.content,
-                    file=msg.file,
-                    created_date=msg.created_date,
-                    sender_id=msg.sender_id
-                ) for msg in message_list
-            ]
+            # Every row carries the index-only probe past the page's last row, computed in
+            # the same query rather than a second round-trip; only full pages can have more
+            has_more = bool(messages) and len(messages) == limit and messages[-1]["has_more"]
+            for message in messages:
+                del message["has_more"]
             
-            # Create next cursor
+            # Create next cursor from the oldest message on this page
             next_cursor = None
-            if message_list and has_more:
-                next_cursor = message_list[-1].created_date.isoformat()
+            if messages and has_more:
+                next_cursor = encode_cursor(messages[-1]["created_date"], messages[-1]["id"])
             
-            response = MessageListResponse(
-                messages=message_responses,
-                next_cursor=next_cursor,
-                has_more=has_more
-            )
+            return ORJSONResponse({
+                "messages": messages,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            })
             
-            # Convert to dict with proper datetime handling
-            response_dict = response.model_dump(mode='json')
-            return JSONResponse(response_dict)
+    except Exception as e:
+        return ORJSONResponse({"error": str(e)}, status_code=500)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, using weak comparison"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+async def get_message(request: Request):
+    """Get a single message with its full content (served from the Redis cache when present)"""
+    try:
+        message_id = request.path_params["message_id"]
+        
+        message_json = await get_message_json(message_id)
+        if message_json is None:
+            return ORJSONResponse({"error": "Message not found"}, status_code=404)
+        
+        # Weak validator over the body, so repeat fetches of an unchanged message get a 304
+        etag = f'W/"{hashlib.blake2b(message_json, digest_size=16).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers=headers)
+        
+        return Response(message_json, media_type="application/json", headers=headers)
             
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return ORJSONResponse({"error": str(e)}, status_code=500)
 
 async def create_message(request: Request):
     """Create a new message"""
     try:
-        # Parse request body
-        body = await request.json()
-        message_data = MessageCreate(**body)
+        # Validate straight from the raw bytes in pydantic-core, without a stdlib json pass
+        message_data = MessageCreate.model_validate_json(await request.body())
         
         # Create database session directly
         async with AsyncSessionLocal() as db:
-            # Create new message
-            new_message = Message(
+            # Insert and read back the server-generated columns in one round-trip
+            stmt = insert(Message).values(
                 content=message_data.content,
                 file=message_data.file,
                 sender_id=message_data.sender_id
-            )
-
-            print("new_message", new_message)
-            
-            db.add(new_message)
-            await db.commit()
-            await db.refresh(new_message)
+            ).returning(Message.id, Message.created_date)
+            row = (await db.execute(stmt)).one()
             
             # Create response
-            print("asdfasfsf")
             response = MessageResponse(
-                id=new_message.id,
-                content=new_message.content,
-                file=new_message.file,
-                created_date=new_message.created_date,
-                sender_id=new_message.sender_id
+                id=row.id,
+                content=message_data.content,
+                file=message_data.file,
+                created_date=row.created_date,
+                sender_id=message_data.sender_id
             )
-            print("asdfasfsf1111", response)
             
-            # Convert to dict with proper datetime handling
-            response_dict = response.model_dump(mode='json')
-            return JSONResponse(response_dict, status_code=201)
+            # Encode once; the same bytes are cached and sent back
+            message_json = orjson.dumps(response.model_dump())
+            
+            await db.commit()
+            # Cache only once committed, so a failed insert is never served; if the
+            # NOTIFY beats the cache write, the listener reads the committed row instead
+            await cache_message(row.id, message_json)
+            
+            return Response(message_json, status_code=201, media_type="application/json")
             
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return ORJSONResponse({"error": str(e)}, status_code=500)
 
 async def stream_endpoint(request: Request):
     """Server-Sent Events endpoint for real-time message streaming"""
     
     async def event_stream():
         """Generate SSE events"""
+        # Each client reads from its own queue, fed by the shared broadcaster
+        queue = message_broadcaster.register()
         try:
-            # Subscribe to Redis channel for new messages
-            pubsub = await redis_client.subscribe('new_messages')
-            
             # Send initial connection message
-            yield f"data: {json.dumps({'type': 'connected', 'message': 'Connected to message stream'})}\n\n"
+            yield SSE_CONNECTED_EVENT
             
-            # Listen for new messages
-            async for message in redis_client.listen():
-                try:
-                    data = json.loads(message)
-                    yield f"data: {json.dumps({'type': 'new_message', 'data': data})}\n\n"
-                except json.JSONDecodeError:
-                    continue
+            # Listen for new messages, coalescing bursts into fewer writes
+            async for chunk in coalesce_sse_events(queue):
+                yield chunk
                     
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            yield sse_event({'type': 'error', 'message': str(e)})
         finally:
-            if redis_client.pubsub:
-                await redis_client.pubsub.unsubscribe('new_messages')
+            message_broadcaster.unregister(queue)
+    
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        return StreamingResponse(
+            gzip_stream(event_stream()),
+            media_type="text/event-stream",
+            headers=SSE_GZIP_HEADERS
+        )
     
     return StreamingResponse(
         event_stream(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Cache-Control"
-        }
+        headers=SSE_HEADERS
     )
 
+async def websocket_stream_endpoint(websocket: WebSocket):
+    """WebSocket endpoint for real-time message streaming (binary frames of UTF-8 JSON)"""
+    await websocket.accept()
+    queue = message_broadcaster.register()
+    
+    async def forward_events():
+        await websocket.send_bytes(CONNECTED_EVENT)
+        while True:
+            await websocket.send_bytes(await queue.get())
+    
+    async def wait_for_disconnect():
+        # Drain client frames so a close is noticed even while no events arrive
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+    
+    sender = asyncio.create_task(forward_events())
+    receiver = asyncio.create_task(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if sender in done:
+            # The sender only stops by failing; close the socket rather than leave it without one
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        # Retrieve both outcomes so a failed send is not reported as never retrieved
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+        message_broadcaster.unregister(queue)
+
+async def health_check(request: Request):
+    """Report database pool usage and Redis reachability"""
+    try:
+        await redis_client.redis_client.ping()
+        redis_status = "connected"
+    except Exception as e:
+        redis_status = f"error: {e}"
+    
+    healthy = redis_status == "connected"
+    return ORJSONResponse({
+        "status": "healthy" if healthy else "unhealthy",
+        "database_pool": engine.pool.status(),
+        "redis": redis_status
+    }, status_code=200 if healthy else 503)
+
 # Create Starlette app AFTER all functions are defined
 app = Starlette(
     debug=Config.DEBUG,
@@ -181,10 +353,14 @@ app = Starlette(
     on_shutdown=[shutdown],
     routes=[
         Route("/api/message", message_endpoint, methods=["GET", "POST"]),
+        Route("/api/message/{message_id:int}", get_message, methods=["GET"]),
         Route("/api/stream", stream_endpoint),
+        Route("/api/health", health_check, methods=["GET"]),
+        WebSocketRoute("/api/ws/stream", websocket_stream_endpoint),
     ],
     middleware=[
-        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(GZipMiddleware, minimum_size=500)
     ]
 )
 
@@ -194,5 +370,8 @@ if __name__ == "__main__":
         app,
         host=Config.HOST,
         port=Config.PORT,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
         log_level="info"
     )
\ No newline at end of file
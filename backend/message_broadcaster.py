@@ -0,0 +1,39 @@
+import asyncio
+from typing import Set
+from config import Config
+
+# Envelope around a new message's JSON: {"type":"new_message","data":<message>}
+NEW_MESSAGE_PREFIX = b'{"type":"new_message","data":'
+NEW_MESSAGE_SUFFIX = b'}'
+
+class MessageBroadcaster:
+    def __init__(self):
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def register(self) -> asyncio.Queue:
+        """Register a new stream client and return its event queue"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=Config.STREAM_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unregister(self, queue: asyncio.Queue):
+        """Remove a stream client's event queue"""
+        self.subscribers.discard(queue)
+
+    def broadcast(self, event: bytes):
+        """Push an encoded event to every connected client"""
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop the event rather than stall everyone else
+                pass
+
+    def broadcast_new_message(self, message: bytes):
+        """Wrap a new message's JSON in the stream envelope and push it to all clients"""
+        if self.subscribers:
+            # Splice the already-encoded JSON in rather than parsing and re-encoding it
+            self.broadcast(NEW_MESSAGE_PREFIX + message + NEW_MESSAGE_SUFFIX)
+
+# Global message broadcaster instance
+message_broadcaster = MessageBroadcaster()
@@ -0,0 +1,84 @@
+import logging
+import orjson
+from typing import Optional
+from sqlalchemy import select, bindparam, any_, cast, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from config import Config
+from database import AsyncSessionLocal, Message
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# asyncpg returns its own UUID subclass, which orjson refuses; read sender_id as text instead
+SENDER_ID_COLUMN = cast(Message.sender_id, String).label("sender_id")
+# Columns returned for a message, in API order
+MESSAGE_COLUMNS = (Message.id, Message.content, Message.file, Message.created_date, SENDER_ID_COLUMN)
+GET_MESSAGE_STMT = select(*MESSAGE_COLUMNS).where(Message.id == bindparam("message_id", type_=Integer))
+# One array parameter, so every batch size shares a single prepared statement
+GET_MESSAGES_STMT = select(*MESSAGE_COLUMNS).where(Message.id == any_(bindparam("message_ids", type_=ARRAY(Integer))))
+
+def message_cache_key(message_id: int) -> str:
+    """Redis key holding a message's JSON"""
+    return f"message:{message_id}"
+
+async def cache_message(message_id: int, message_json: bytes):
+    """Cache a message's JSON in Redis; failures only cost a later database read"""
+    try:
+        await redis_client.set(message_cache_key(message_id), message_json, ex=Config.MESSAGE_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Failed to cache message %s: %s", message_id, e)
+
+async def cache_messages(messages: dict[int, bytes]):
+    """Cache several messages' JSON in one pipelined round-trip"""
+    if not messages:
+        return
+    try:
+        pipe = await redis_client.pipeline(transaction=False)
+        for message_id, message_json in messages.items():
+            pipe.set(message_cache_key(message_id), message_json, ex=Config.MESSAGE_CACHE_TTL)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to cache %d messages: %s", len(messages), e)
+
+async def get_message_json(message_id: int) -> Optional[bytes]:
+    """Get a message's JSON from the Redis cache, falling back to PostgreSQL on a miss or Redis error"""
+    try:
+        cached = await redis_client.get(message_cache_key(message_id))
+        if cached is not None:
+            return cached.encode()
+    except Exception as e:
+        logger.warning("Failed to read cached message %s: %s", message_id, e)
+
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(GET_MESSAGE_STMT, {"message_id": message_id})).mappings().first()
+    if row is None:
+        return None
+
+    message_json = orjson.dumps(dict(row))
+    await cache_message(message_id, message_json)
+    return message_json
+
+async def get_messages_json(message_ids: list[int]) -> list[Optional[bytes]]:
+    """Get several messages' JSON with one Redis MGET and at most one PostgreSQL query, in id order"""
+    try:
+        cached = await redis_client.mget([message_cache_key(message_id) for message_id in message_ids])
+    except Exception as e:
+        logger.warning("Failed to read %d cached messages: %s", len(message_ids), e)
+        cached = [None] * len(message_ids)
+    found = {message_id: value.encode() for message_id, value in zip(message_ids, cached) if value is not None}
+
+    missing = [message_id for message_id in message_ids if message_id not in found]
+    if missing:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(GET_MESSAGES_STMT, {"message_ids": missing})).mappings().all()
+        fetched = {}
+        for row in rows:
+            # A row that fails to encode costs only its own message, not the batch
+            try:
+                fetched[row["id"]] = orjson.dumps(dict(row))
+            except TypeError as e:
+                logger.error("Failed to encode message %s: %s", row["id"], e)
+        await cache_messages(fetched)
+        found.update(fetched)
+
+    return [found.get(message_id) for message_id in message_ids]
@@ -1,14 +1,48 @@
 import asyncio
 import asyncpg
-import json
+import logging
+import orjson
+import redis.asyncio as redis
 from typing import Optional
 from config import Config
 from redis_client import redis_client
+from message_broadcaster import message_broadcaster
+from message_store import get_messages_json, message_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Redis channel for each operation tag prefixed to the NOTIFY payload
+NOTIFY_TAG_CHANNELS = {
+    'I': 'new_messages',
+    'U': 'updated_messages',
+    'D': 'deleted_messages'
+}
+
+def dedup_updates(batch: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """Collapse repeated UPDATE notifications for a message to the last one in the batch"""
+    # Update payloads carry only the id, so identical messages mean the same row
+    last_update = {message: i for i, (channel, message) in enumerate(batch) if channel == 'updated_messages'}
+    return [
+        (channel, message) for i, (channel, message) in enumerate(batch)
+        if channel != 'updated_messages' or last_update[message] == i
+    ]
 
 class PostgresListener:
     def __init__(self):
         self.connection: Optional[asyncpg.Connection] = None
         self.is_listening = False
+        # The event and queues are created in listen_for_changes, on the running
+        # loop; on Python < 3.10 they would otherwise bind to the import-time loop
+        # Set by stop() to release listen_for_changes
+        self._stop_event: Optional[asyncio.Event] = None
+        # Redis client bound once listening starts, after the app has connected it
+        self.redis: Optional[redis.Redis] = None
+        # (channel, message) pairs waiting to be published to Redis in batches
+        self.publish_queue: Optional[asyncio.Queue] = None
+        self.publisher_task: Optional[asyncio.Task] = None
+        # Ids of inserted messages waiting to be sent to this process's stream clients
+        self.insert_queue: Optional[asyncio.Queue] = None
+        self.inserts_task: Optional[asyncio.Task] = None
         
     async def connect(self):
         """Connect to PostgreSQL"""
@@ -20,9 +54,9 @@ class PostgresListener:
                 password=Config.POSTGRES_PASSWORD,
                 database=Config.POSTGRES_DB
             )
-            print("Connected to PostgreSQL for listening")
+            logger.info("Connected to PostgreSQL for listening")
         except Exception as e:
-            print(f"Failed to connect to PostgreSQL: {e}")
+            logger.error("Failed to connect to PostgreSQL: %s", e)
             raise
     
     async def disconnect(self):
@@ -30,42 +64,20 @@ class PostgresListener:
         if self.connection:
             await self.connection.close()
             self.connection = None
-            print("Disconnected from PostgreSQL")
+            logger.info("Disconnected from PostgreSQL")
     
     async def create_notify_function(self):
         """Create a function to notify on table changes"""
         try:
+            # Notify with only the operation tag and id; consumers fetch the row if they need it
             await self.connection.execute("""
                 CREATE OR REPLACE FUNCTION notify_message_change()
                 RETURNS TRIGGER AS $$
                 BEGIN
-                    IF TG_OP = 'INSERT' THEN
-                        PERFORM pg_notify('message_changes', json_build_object(
-                            'operation', TG_OP,
-                            'id', NEW.id,
-                            'content', NEW.content,
-                            'file', NEW.file,
-                            'created_date', NEW.created_date,
-                            'sender_id', NEW.sender_id
-                        )::text);
-                        RETURN NEW;
-                    ELSIF TG_OP = 'UPDATE' THEN
-                        PERFORM pg_notify('message_changes', json_build_object(
-                            'operation', TG_OP,
-                            'id', NEW.id,
-                            'content', NEW.content,
-                            'file', NEW.file,
-                            'created_date', NEW.created_date,
-                            'sender_id', NEW.sender_id
-                        )::text);
-                        RETURN NEW;
-                    ELSIF TG_OP = 'DELETE' THEN
-                        PERFORM pg_notify('message_changes', json_build_object(
-                            'operation', TG_OP,
-                            'id', OLD.id
-                        )::text);
-                        RETURN OLD;
-                    END IF;
+                    -- NEW is NULL for DELETE, OLD is NULL for INSERT
+                    PERFORM pg_notify('message_changes', format(
+                        '%s|{"operation":"%s","id":%s}', left(TG_OP, 1), TG_OP, COALESCE(NEW.id, OLD.id)
+                    ));
                     RETURN NULL;
                 END;
                 $$ LANGUAGE plpgsql;
@@ -79,9 +91,9 @@ class PostgresListener:
                 FOR EACH ROW EXECUTE FUNCTION notify_message_change();
             """)
             
-            print("Created notify function and trigger")
+            logger.info("Created notify function and trigger")
         except Exception as e:
-            print(f"Failed to create notify function: {e}")
+            logger.warning("Failed to create notify function: %s", e)
             # Continue anyway as the trigger might already exist
     
     async def listen_for_changes(self):
@@ -91,52 +103,138 @@ class PostgresListener:
         
         await self.create_notify_function()
         
+        self._stop_event = asyncio.Event()
+        self.publish_queue = asyncio.Queue()
+        self.insert_queue = asyncio.Queue()
+        
+        # Publish to Redis from a single batching task
+        self.redis = redis_client.redis_client
+        self.publisher_task = asyncio.create_task(self.publish_batches())
+        self.inserts_task = asyncio.create_task(self.broadcast_inserts())
+        
         # Listen for notifications
         await self.connection.add_listener('message_changes', self.handle_notification)
         self.is_listening = True
-        print("Listening for PostgreSQL notifications on 'message_changes' channel")
+        logger.info("Listening for PostgreSQL notifications on 'message_changes' channel")
         
-        # Keep the connection alive
-        while self.is_listening:
-            try:
-                await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                break
+        # Keep the connection alive until stopped; asyncpg delivers notifications meanwhile
+        await self._stop_event.wait()
     
     async def handle_notification(self, connection, pid, channel, payload):
         """Handle PostgreSQL notifications and publish to Redis"""
         try:
-            data = json.loads(payload)
-            operation = data.get('operation')
+            # Payloads are '<op tag>|<json>', so dispatch without parsing the JSON
+            target_channel = NOTIFY_TAG_CHANNELS.get(payload[0])
+            if target_channel is None:
+                return
+            message = payload[2:]
             
-            if operation == 'INSERT':
-                # Publish new message to Redis
-                await redis_client.publish('new_messages', payload)
-                print(f"Published new message {data.get('id')} to Redis")
-            elif operation == 'UPDATE':
-                # Publish updated message to Redis
-                await redis_client.publish('updated_messages', payload)
-                print(f"Published updated message {data.get('id')} to Redis")
-            elif operation == 'DELETE':
-                # Publish deleted message to Redis
-                await redis_client.publish('deleted_messages', payload)
-                print(f"Published deleted message {data.get('id')} to Redis")
+            if target_channel == 'new_messages' and message_broadcaster.subscribers:
+                # Stream clients need the full row, fetched in order by broadcast_inserts
+                self.insert_queue.put_nowait(orjson.loads(message)['id'])
+            # Queue for the batch publisher instead of awaiting a Redis round-trip here
+            self.publish_queue.put_nowait((target_channel, message))
                 
         except Exception as e:
-            print(f"Error handling notification: {e}")
+            logger.error("Error handling notification: %s", e)
+    
+    async def collect_batch(self, batch: list[tuple[str, str]]):
+        """Wait for the next queued notification and gather a batch around it into `batch`"""
+        # Filled in place so a batch interrupted by stop() can still be published
+        loop = asyncio.get_running_loop()
+        batch.append(await self.publish_queue.get())
+        # Let the batch grow for a short linger window
+        deadline = loop.time() + Config.PG_PUBLISH_LINGER_MS / 1000
+        while len(batch) < Config.PG_PUBLISH_BATCH_MAX:
+            try:
+                batch.append(self.publish_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.publish_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+    
+    async def flush_batch(self, batch: list[tuple[str, str]]):
+        """Publish a batch of notifications to Redis in one pipeline"""
+        # Inserts and deletes stay one-shot; only update churn is debounced
+        if Config.PG_DEDUP_UPDATES:
+            batch = dedup_updates(batch)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for channel, message in batch:
+                if channel != 'new_messages':
+                    # Updated and deleted messages must not be served from the cache
+                    pipe.delete(message_cache_key(orjson.loads(message)['id']))
+                pipe.publish(channel, message)
+            await pipe.execute()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Published %d notifications to Redis", len(batch))
+        except Exception as e:
+            logger.error("Error publishing %d notifications: %s", len(batch), e)
+    
+    async def publish_batches(self):
+        """Publish queued notifications to Redis, one pipeline per batch"""
+        in_flight: Optional[asyncio.Task] = None
+        batch: list[tuple[str, str]] = []
+        try:
+            while True:
+                await self.collect_batch(batch)
+                # The next batch was gathered while the previous one's reply was
+                # outstanding; wait for it only now so batches stay in order.
+                # Shielded so cancelling this task never aborts a pipeline mid-flight
+                if in_flight:
+                    await asyncio.shield(in_flight)
+                in_flight = asyncio.create_task(self.flush_batch(batch))
+                batch = []
+        finally:
+            # On shutdown, let the last pipeline land, then publish the batch being
+            # collected and anything still queued rather than dropping them
+            if in_flight:
+                await asyncio.shield(in_flight)
+            while not self.publish_queue.empty():
+                batch.append(self.publish_queue.get_nowait())
+            for start in range(0, len(batch), Config.PG_PUBLISH_BATCH_MAX):
+                await self.flush_batch(batch[start:start + Config.PG_PUBLISH_BATCH_MAX])
+    
+    async def broadcast_inserts(self):
+        """Send inserted messages to this process's stream clients, in notification order"""
+        while True:
+            # Fetch everything queued so far together: one Redis MGET per batch, not per message
+            message_ids = [await self.insert_queue.get()]
+            while not self.insert_queue.empty() and len(message_ids) < Config.PG_PUBLISH_BATCH_MAX:
+                message_ids.append(self.insert_queue.get_nowait())
+            try:
+                for message_json in await get_messages_json(message_ids):
+                    if message_json is not None:
+                        message_broadcaster.broadcast_new_message(message_json)
+            except Exception as e:
+                logger.error("Error broadcasting %d messages: %s", len(message_ids), e)
     
     async def start(self):
         """Start listening for PostgreSQL changes"""
         try:
             await self.listen_for_changes()
         except Exception as e:
-            print(f"Error in PostgreSQL listener: {e}")
+            logger.error("Error in PostgreSQL listener: %s", e)
             await self.disconnect()
     
     async def stop(self):
         """Stop listening for PostgreSQL changes"""
         self.is_listening = False
+        if self._stop_event:
+            self._stop_event.set()
+        # Close the connection first so no notifications arrive after the queues are drained
         await self.disconnect()
+        tasks = [task for task in (self.publisher_task, self.inserts_task) if task]
+        for task in tasks:
+            task.cancel()
+        # Wait for the tasks to unwind so pending publishes finish before Redis goes away
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.publisher_task = None
+        self.inserts_task = None
 
 # Global PostgreSQL listener instance
 postgres_listener = PostgresListener()
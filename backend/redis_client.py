@@ -1,75 +1,65 @@
 import redis.asyncio as redis
 from typing import Optional, Any, Dict, List
-import json
+import logging
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 class RedisClient:
+    # connect() is awaited once at app startup, so the hot command wrappers
+    # below use the client directly instead of re-checking the connection
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
-        self.pubsub: Optional[redis.client.PubSub] = None
+        self.pool: Optional[redis.BlockingConnectionPool] = None
         
     async def connect(self):
         """Connect to Redis"""
         if not self.redis_client:
-            self.redis_client = redis.Redis(
+            # Bounded shared pool; callers wait for a free connection instead of erroring
+            self.pool = redis.BlockingConnectionPool(
                 host=Config.REDIS_HOST,
                 port=Config.REDIS_PORT,
                 db=Config.REDIS_DB,
                 password=Config.REDIS_PASSWORD,
+                max_connections=Config.REDIS_MAX_CONNECTIONS,
+                health_check_interval=30,
+                socket_keepalive=True,
                 decode_responses=True,
                 encoding='utf-8'
             )
+            self.redis_client = redis.Redis(connection_pool=self.pool)
             # Test connection
             await self.redis_client.ping()
-            print("Connected to Redis")
+            logger.info("Connected to Redis")
             
     async def disconnect(self):
         """Disconnect from Redis"""
         if self.redis_client:
             await self.redis_client.close()
+            await self.pool.disconnect()
             self.redis_client = None
-            print("Disconnected from Redis")
+            self.pool = None
+            logger.info("Disconnected from Redis")
             
     async def get(self, key: str) -> Optional[str]:
         """Get value by key"""
-        if not self.redis_client:
-            await self.connect()
         return await self.redis_client.get(key)
     
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """Get the values of several keys in one round-trip"""
+        return await self.redis_client.mget(keys)
+    
     async def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
         """Set key-value pair with optional expiration"""
-        if not self.redis_client:
-            await self.connect()
         return await self.redis_client.set(key, value, ex=ex)
     
     async def publish(self, channel: str, message: str) -> int:
         """Publish message to channel"""
-        if not self.redis_client:
-            await self.connect()
         return await self.redis_client.publish(channel, message)
     
-    async def pipeline(self) -> redis.client.Pipeline:
+    async def pipeline(self, transaction: bool = True) -> redis.client.Pipeline:
         """Get Redis pipeline for batch operations"""
-        if not self.redis_client:
-            await self.connect()
-        return self.redis_client.pipeline()
-    
-    async def subscribe(self, channel: str):
-        """Subscribe to a Redis channel"""
-        if not self.redis_client:
-            await self.connect()
-        self.pubsub = self.redis_client.pubsub()
-        await self.pubsub.subscribe(channel)
-        return self.pubsub
-    
-    async def listen(self):
-        """Listen for messages on subscribed channels"""
-        if not self.pubsub:
-            raise RuntimeError("Must subscribe to channels before listening")
-        
-        async for message in self.pubsub.listen():
-            if message['type'] == 'message':
-                yield message['data']
+        return self.redis_client.pipeline(transaction=transaction)
 
 # Global Redis client instance
 redis_client = RedisClient()
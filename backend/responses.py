@@ -0,0 +1,8 @@
+import orjson
+from starlette.responses import JSONResponse
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, which encodes datetimes and UUIDs natively"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
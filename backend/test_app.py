@@ -5,15 +5,20 @@ Simple test script for the Starlette chatroom backend
 
 import asyncio
 import aiohttp
-import json
+import io
+import logging
+import sys
+import orjson
 import uuid
 from datetime import datetime
 
-BASE_URL = "http://localhost:8000"
+BASE_URL = "http://localhost:8000/api"
 
-async def test_create_message():
+logger = logging.getLogger(__name__)
+
+async def test_create_message(session: aiohttp.ClientSession):
     """Test creating a new message"""
-    print("Testing message creation...")
+    logger.info("Testing message creation...")
     
     message_data = {
         "content": "Hello, world! 👋 你好世界！",
@@ -21,84 +26,134 @@ async def test_create_message():
         "sender_id": str(uuid.uuid4())
     }
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{BASE_URL}/message",
-            json=message_data
-        ) as response:
-            if response.status == 201:
-                result = await response.json()
-                print(f"✅ Message created: {result}")
-                return result
-            else:
-                print(f"❌ Failed to create message: {response.status}")
-                return None
+    async with session.post(
+        f"{BASE_URL}/message",
+        json=message_data
+    ) as response:
+        if response.status == 201:
+            result = await response.json(loads=orjson.loads)
+            logger.info(f"✅ Message created: {result}")
+            return result
+        else:
+            logger.info(f"❌ Failed to create message: {response.status}")
+            return None
 
-async def test_get_messages():
+async def test_get_messages(session: aiohttp.ClientSession):
     """Test retrieving messages"""
-    print("Testing message retrieval...")
+    logger.info("Testing message retrieval...")
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BASE_URL}/message?limit=5") as response:
-            if response.status == 200:
-                result = await response.json()
-                print(f"✅ Messages retrieved: {len(result['messages'])} messages")
-                print(f"   Has more: {result['has_more']}")
-                if result['next_cursor']:
-                    print(f"   Next cursor: {result['next_cursor']}")
-                return result
-            else:
-                print(f"❌ Failed to retrieve messages: {response.status}")
-                return None
+    async with session.get(f"{BASE_URL}/message?limit=5") as response:
+        if response.status == 200:
+            result = await response.json(loads=orjson.loads)
+            logger.info(f"✅ Messages retrieved: {len(result['messages'])} messages")
+            logger.info(f"   Has more: {result['has_more']}")
+            if result['next_cursor']:
+                logger.info(f"   Next cursor: {result['next_cursor']}")
+            return result
+        else:
+            logger.info(f"❌ Failed to retrieve messages: {response.status}")
+            return None
+
+async def test_read_back(session: aiohttp.ClientSession, message: dict):
+    """Test that a created message reads back from the database with the same sender_id"""
+    logger.info("Testing message read-back...")
+    
+    async with session.get(f"{BASE_URL}/message?limit=5") as response:
+        if response.status != 200:
+            logger.info(f"❌ Failed to read back messages: {response.status}")
+            return False
+        result = await response.json(loads=orjson.loads)
+    
+    stored = next((m for m in result['messages'] if m['id'] == message['id']), None)
+    if stored and stored['sender_id'] == message['sender_id']:
+        logger.info(f"✅ Message {message['id']} read back with sender {stored['sender_id']}")
+        return True
+    logger.info(f"❌ Message {message['id']} not read back intact: {stored}")
+    return False
 
-async def test_stream_connection():
+async def test_stream_connection(session: aiohttp.ClientSession):
     """Test SSE stream connection"""
-    print("Testing SSE stream connection...")
+    logger.info("Testing SSE stream connection...")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{BASE_URL}/stream") as response:
-                if response.status == 200:
-                    print("✅ SSE stream connected")
-                    # Read first few lines to verify connection
-                    async for line in response.content:
-                        line_str = line.decode('utf-8').strip()
-                        if line_str.startswith('data: '):
-                            data = json.loads(line_str[6:])
-                            print(f"   Received: {data['type']}")
+        async with session.get(f"{BASE_URL}/stream") as response:
+            if response.status == 200:
+                logger.info("✅ SSE stream connected")
+                # Split raw chunks on LF ourselves until the first data line arrives
+                buffer = bytearray()
+                async for chunk in response.content.iter_any():
+                    buffer.extend(chunk)
+                    data = None
+                    while (index := buffer.find(b"\n")) != -1:
+                        line = bytes(buffer[:index]).rstrip(b"\r")
+                        del buffer[:index + 1]
+                        if line.startswith(b"data: "):
+                            data = orjson.loads(line[6:])
                             break
-                    return True
-                else:
-                    print(f"❌ Failed to connect to stream: {response.status}")
-                    return False
+                    if data is not None:
+                        logger.info(f"   Received: {data['type']}")
+                        break
+                return True
+            else:
+                logger.info(f"❌ Failed to connect to stream: {response.status}")
+                return False
     except Exception as e:
-        print(f"❌ Stream connection error: {e}")
+        logger.info(f"❌ Stream connection error: {e}")
         return False
 
 async def main():
     """Run all tests"""
-    print("🚀 Starting Starlette Chatroom Backend Tests")
-    print("=" * 50)
-    
-    # Test message creation
-    message = await test_create_message()
-    
-    # Test message retrieval
-    messages = await test_get_messages()
+    logger.info("🚀 Starting Starlette Chatroom Backend Tests")
+    logger.info("=" * 50)
     
-    # Test stream connection
-    stream_ok = await test_stream_connection()
+    # One session for every test, so connections are kept alive and reused;
+    # resolved addresses are cached (aiohttp already sets TCP_NODELAY)
+    connector = aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=20,
+        keepalive_timeout=30,
+        use_dns_cache=True,
+        ttl_dns_cache=300
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # The checks are independent, so run them concurrently
+        message, messages, stream_ok = await asyncio.gather(
+            test_create_message(session),
+            test_get_messages(session),
+            test_stream_connection(session)
+        )
+        # Needs the created message, so it runs after the others
+        read_back = await test_read_back(session, message) if message else False
     
-    print("\n" + "=" * 50)
-    print("📊 Test Results Summary:")
-    print(f"   Message Creation: {'✅ PASS' if message else '❌ FAIL'}")
-    print(f"   Message Retrieval: {'✅ PASS' if messages else '❌ FAIL'}")
-    print(f"   Stream Connection: {'✅ PASS' if stream_ok else '❌ FAIL'}")
+    logger.info("\n" + "=" * 50)
+    logger.info("📊 Test Results Summary:")
+    logger.info(f"   Message Creation: {'✅ PASS' if message else '❌ FAIL'}")
+    logger.info(f"   Message Retrieval: {'✅ PASS' if messages else '❌ FAIL'}")
+    logger.info(f"   Stream Connection: {'✅ PASS' if stream_ok else '❌ FAIL'}")
+    logger.info(f"   Message Read-back: {'✅ PASS' if read_back else '❌ FAIL'}")
     
-    if all([message, messages, stream_ok]):
-        print("\n🎉 All tests passed! The backend is working correctly.")
+    if all([message, messages, stream_ok, read_back]):
+        logger.info("\n🎉 All tests passed! The backend is working correctly.")
     else:
-        print("\n⚠️  Some tests failed. Check the logs above for details.")
+        logger.info("\n⚠️  Some tests failed. Check the logs above for details.")
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to the end of the run instead of after every record"""
+    def flush(self):
+        pass
+
+def setup_logging() -> io.TextIOWrapper:
+    """Log to a block-buffered stdout so lines are written together rather than one syscall each"""
+    stream = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", line_buffering=False)
+    handler = BufferedStreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return stream
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    stream = setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        stream.flush()
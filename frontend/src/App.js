@@ -26,7 +26,8 @@ function App() {
         const response = await fetch(API_ENDPOINTS.MESSAGES);
         if (response.ok) {
           const data = await response.json();
-          setMessages(data.messages);
+          // The API returns newest first; display oldest at the top
+          setMessages(data.messages.slice().reverse());
         }
       } catch (error) {
         console.error('Error loading old messages:', error);